@@ -3,38 +3,115 @@
 """
 
 import pandas as pd
-import psycopg2
 import os
+import logging
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+from psycopg2 import pool
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Сколько байт выгрузки держать в памяти, прежде чем сбросить буфер на диск
+COPY_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# Идентификаторы укладываются в int32: вдвое меньше памяти и быстрее groupby
+PURCHASE_ID_DTYPES = {'user_id': 'int32', 'course_id': 'int32'}
+
+# Локальный кэш выгрузки покупок, чтобы не обращаться к базе при повторных запусках
+PURCHASE_CACHE_PATH = os.path.join('cache', 'purchases.parquet')
+
+# Кэш старше этого срока (в секундах) считается устаревшим и загружается заново
+PURCHASE_CACHE_MAX_AGE = 24 * 60 * 60
+
+# Параметры подключения читаются из окружения (.env) один раз при импорте модуля.
+# Учетные данные в коде не храним
+_PG_KWARGS = {
+    'host': os.getenv('DB_HOST'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'dbname': os.getenv('DB_NAME'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+}
+
+# Пул соединений создается лениво при первом обращении к базе;
+# блокировка не дает параллельным потокам создать несколько пулов
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool():
+    """
+    Возвращает пул соединений, создавая его при первом вызове
+    """
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            # Повторная проверка: пул мог создать другой поток, пока мы ждали блокировку
+            if _POOL is None:
+                if _PG_KWARGS['password'] is None:
+                    raise ConnectionError("Не задана переменная окружения DB_PASSWORD")
+                _POOL = pool.ThreadedConnectionPool(minconn=1, maxconn=8, **_PG_KWARGS)
+    return _POOL
+
+def _close_pool():
+    """Закрывает все соединения пула при завершении процесса"""
+    if _POOL is not None:
+        _POOL.closeall()
+
+atexit.register(_close_pool)
+
 def connect_to_db():
     """
-    Устанавливает соединение с базой данных
-    Возвращает объект соединения или None в случае ошибки
+    Берет соединение с базой данных из пула
+    Возвращает объект соединения или None в случае ошибки.
+    После использования соединение нужно вернуть через release_conn()
     """
     try:
-        connection = psycopg2.connect(
-            host=os.getenv('DB_HOST', '84.201.134.129'),
-            port=os.getenv('DB_PORT', '5432'),
-            database=os.getenv('DB_NAME', 'skillfactory'),
-            user=os.getenv('DB_USER', 'skillfactory'),
-            password=os.getenv('DB_PASSWORD', 'cCkxxLVrDE8EbvjueeMedPKt')
-        )
-        print("✅ Успешное подключение к базе данных")
+        connection = _get_pool().getconn()
+        logger.info("✅ Успешное подключение к базе данных")
         return connection
     except Exception as e:
-        print(f"❌ Ошибка подключения к базе данных: {e}")
+        logger.error("❌ Ошибка подключения к базе данных: %s", e)
         return None
 
-def load_purchase_data():
+def release_conn(conn):
     """
-    Загружает данные о покупках курсов пользователями
-    Возвращает DataFrame с информацией о пользователях и купленных курсах
+    Возвращает соединение в пул
+    """
+    _get_pool().putconn(conn)
+
+@contextmanager
+def pooled_connection():
     """
-    query = """
+    Контекстный менеджер для работы с базой: берет соединение из пула,
+    завершает транзакцию (commit или rollback при ошибке) и всегда
+    возвращает соединение в пул, даже если запрос упал
+    """
+    conn = connect_to_db()
+    if conn is None:
+        raise ConnectionError("Не удалось подключиться к базе данных")
+    try:
+        with conn:
+            yield conn
+    finally:
+        release_conn(conn)
+
+def invalidate_cache(cache_path=PURCHASE_CACHE_PATH):
+    """
+    Удаляет кэш выгрузки покупок, чтобы следующая загрузка шла из базы
+    """
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+        logger.info("🗑️ Кэш удален: %s", cache_path)
+
+# Успешные покупки курсов и пользователи, купившие больше одного курса
+PURCHASES_CTE = """
     WITH successful_purchases AS (
         SELECT 
             c.user_id,
@@ -57,6 +134,52 @@ def load_purchase_data():
         GROUP BY user_id
         HAVING COUNT(DISTINCT course_id) > 1
     )
+"""
+
+def _read_cache(cache_path, max_age):
+    """
+    Читает выгрузку из Parquet-кэша.
+    Возвращает None, если кэша нет, он старше max_age секунд или поврежден
+    """
+    if not os.path.exists(cache_path):
+        return None
+    
+    if max_age is not None:
+        age = time.time() - os.path.getmtime(cache_path)
+        if age > max_age:
+            logger.info("⌛ Кэш %s устарел (%.0f ч), загружаем данные из базы", cache_path, age / 3600)
+            return None
+    
+    try:
+        df = pd.read_parquet(cache_path)
+    except Exception as e:
+        logger.warning("⚠️ Не удалось прочитать кэш %s, загружаем данные из базы: %s", cache_path, e)
+        return None
+    
+    logger.info("✅ Загружено %d записей о покупках из кэша %s", len(df), cache_path)
+    return df
+
+def load_purchase_data(use_cache=True, cache_path=PURCHASE_CACHE_PATH, cache_max_age=PURCHASE_CACHE_MAX_AGE):
+    """
+    Загружает данные о покупках курсов пользователями
+    Возвращает DataFrame с информацией о пользователях и купленных курсах
+    
+    Parameters:
+    -----------
+    use_cache : bool
+        Читать данные из Parquet-кэша, если он есть, и сохранять туда свежую выгрузку
+    cache_path : str
+        Путь к файлу кэша
+    cache_max_age : float or None
+        Максимальный возраст кэша в секундах (по времени изменения файла);
+        более старый кэш игнорируется. None - без ограничения
+    """
+    if use_cache:
+        df = _read_cache(cache_path, cache_max_age)
+        if df is not None:
+            return df
+    
+    query = PURCHASES_CTE + """
     SELECT 
         sp.user_id,
         sp.course_id,
@@ -68,46 +191,123 @@ def load_purchase_data():
     """
     
     try:
-        conn = connect_to_db()
-        if conn is None:
-            raise ConnectionError("Не удалось подключиться к базе данных")
+        # COPY отдает результат одним потоком CSV, минуя построчную выборку через курсор.
+        # Большие выгрузки не держим целиком в памяти: буфер уходит на диск
+        # после COPY_SPOOL_MAX_SIZE байт
+        copy_sql = f"COPY ({query}) TO STDOUT WITH CSV HEADER"
+        with SpooledTemporaryFile(max_size=COPY_SPOOL_MAX_SIZE) as buf:
+            with pooled_connection() as conn, conn.cursor() as cur:
+                cur.copy_expert(copy_sql, buf)
+            
+            buf.seek(0)
+            df = pd.read_csv(
+                buf,
+                dtype=PURCHASE_ID_DTYPES,
+                parse_dates=['purchased_at', 'updated_at']
+            )
         
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        logger.info("✅ Загружено %d записей о покупках", len(df))
+        logger.info("✅ Уникальных пользователей: %d", df['user_id'].nunique())
+        logger.info("✅ Уникальных курсов: %d", df['course_id'].nunique())
+    except Exception as e:
+        logger.error("❌ Ошибка при загрузке данных: %s", e)
+        # Возвращаем пустой DataFrame для возможности тестирования
+        return pd.DataFrame(
+            columns=['user_id', 'course_id', 'purchased_at', 'updated_at']
+        ).astype(PURCHASE_ID_DTYPES)
+    
+    if use_cache:
+        _write_cache(df, cache_path)
+    
+    return df
+
+def _write_cache(df, cache_path):
+    """
+    Сохраняет выгрузку в Parquet-кэш. Ошибка записи не должна терять
+    уже загруженные данные, поэтому она только логируется.
+    Пишем во временный файл и атомарно подменяем, чтобы не оставить
+    недописанный кэш
+    """
+    tmp_path = cache_path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, cache_path)
+        logger.info("💾 Данные сохранены в кэш: %s", cache_path)
+    except Exception as e:
+        # Любая ошибка pyarrow (нет кодека, неподдерживаемый тип столбца) или
+        # файловой системы: данные из базы уже загружены, кэш просто пропускаем
+        logger.warning("⚠️ Не удалось сохранить кэш %s: %s", cache_path, e)
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except OSError:
+            pass
+
+def load_user_course_lists():
+    """
+    Загружает списки уникальных курсов каждого пользователя, агрегированные в базе
+    
+    В отличие от load_purchase_data возвращает одну строку на пользователя,
+    поэтому по сети передается меньше данных, а analyze_joint_purchases
+    может строить пары без повторной группировки в pandas.
+    
+    Returns:
+    --------
+    DataFrame : Столбцы user_id и courses (отсортированный список ID курсов)
+    """
+    query = PURCHASES_CTE + """
+    SELECT 
+        sp.user_id,
+        ARRAY_AGG(DISTINCT sp.course_id ORDER BY sp.course_id) as courses
+    FROM successful_purchases sp
+    JOIN user_course_counts ucc ON sp.user_id = ucc.user_id
+    GROUP BY sp.user_id
+    """
+    
+    try:
+        # Строк здесь столько же, сколько пользователей, поэтому хватает обычного курсора;
+        # psycopg2 сам превращает массивы PostgreSQL в списки Python
+        with pooled_connection() as conn, conn.cursor() as cur:
+            cur.execute(query)
+            rows = cur.fetchall()
         
-        print(f"✅ Загружено {len(df):,} записей о покупках")
-        print(f"✅ Уникальных пользователей: {df['user_id'].nunique():,}")
-        print(f"✅ Уникальных курсов: {df['course_id'].nunique():,}")
+        df = pd.DataFrame(rows, columns=['user_id', 'courses'])
+        df['user_id'] = df['user_id'].astype(PURCHASE_ID_DTYPES['user_id'])
         
+        logger.info("✅ Загружены списки курсов для %d пользователей", len(df))
         return df
     except Exception as e:
-        print(f"❌ Ошибка при загрузке данных: {e}")
-        # Возвращаем пустой DataFrame для возможности тестирования
-        return pd.DataFrame(columns=['user_id', 'course_id', 'purchased_at', 'updated_at'])
+        logger.error("❌ Ошибка при загрузке данных: %s", e)
+        return pd.DataFrame(columns=['user_id', 'courses'])
 
 def get_purchase_statistics(df):
     """
     Выводит статистику по загруженным данным о покупках
     """
     if df.empty:
-        print("❌ DataFrame пустой")
+        logger.warning("❌ DataFrame пустой")
         return
     
-    print("📊 СТАТИСТИКА ПОКУПОК:")
-    print(f"   • Всего записей: {len(df):,}")
-    print(f"   • Уникальных пользователей: {df['user_id'].nunique():,}")
-    print(f"   • Уникальных курсов: {df['course_id'].nunique():,}")
-    print(f"   • Период данных: с {df['purchased_at'].min()} по {df['purchased_at'].max()}")
+    # Количество покупок на пользователя: один проход groupby без сортировки ключей,
+    # из него же берем число уникальных пользователей
+    purchases_per_user = df.groupby('user_id', sort=False, observed=True)['course_id'].nunique()
+    period = df['purchased_at'].agg(['min', 'max'])
+    
+    logger.info("📊 СТАТИСТИКА ПОКУПОК:")
+    logger.info("   • Всего записей: %d", len(df))
+    logger.info("   • Уникальных пользователей: %d", len(purchases_per_user))
+    logger.info("   • Уникальных курсов: %d", df['course_id'].nunique())
+    logger.info("   • Период данных: с %s по %s", period['min'], period['max'])
     
-    # Количество покупок на пользователя
-    purchases_per_user = df.groupby('user_id')['course_id'].nunique()
-    print(f"   • Среднее количество курсов на пользователя: {purchases_per_user.mean():.2f}")
-    print(f"   • Максимальное количество курсов у одного пользователя: {purchases_per_user.max()}")
+    logger.info("   • Среднее количество курсов на пользователя: %.2f", purchases_per_user.mean())
+    logger.info("   • Максимальное количество курсов у одного пользователя: %s", purchases_per_user.max())
     
     return purchases_per_user
 
 if __name__ == "__main__":
     # Тестирование модуля
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     print("Тестирование модуля data_loader.py")
     print("=" * 50)
     
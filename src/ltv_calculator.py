@@ -5,9 +5,11 @@
 import numpy as np
 import pandas as pd
 import math
-from scipy import stats
-import matplotlib.pyplot as plt
+import functools
 
+# Результат зависит только от скалярных аргументов, поэтому повторные расчеты
+# одних и тех же сценариев берем из кэша
+@functools.lru_cache(maxsize=256)
 def calculate_ltv(avg_purchase_value, purchase_frequency, customer_lifespan, 
                   retention_rate=None, discount_rate=0.1):
     """
@@ -26,6 +28,9 @@ def calculate_ltv(avg_purchase_value, purchase_frequency, customer_lifespan,
     discount_rate : float
         Ставка дисконтирования
         
+    Все аргументы должны быть хешируемыми скалярами (результаты кэшируются);
+    для массивов используйте calculate_ltv_batch
+        
     Returns:
     --------
     float : LTV
@@ -34,15 +39,62 @@ def calculate_ltv(avg_purchase_value, purchase_frequency, customer_lifespan,
         # Простая модель: LTV = Avg Purchase Value * Purchase Frequency * Customer Lifespan
         ltv = avg_purchase_value * purchase_frequency * customer_lifespan
     else:
-        # Модель с учетом retention rate и дисконтирования
-        ltv = 0
-        for year in range(1, int(customer_lifespan) + 1):
-            year_value = avg_purchase_value * purchase_frequency * (retention_rate / 100) ** (year - 1)
-            discounted_value = year_value / ((1 + discount_rate) ** (year - 1))
-            ltv += discounted_value
+        # Модель с учетом retention rate и дисконтирования:
+        # сумма геометрической прогрессии по годам со знаменателем q
+        # Как и в исходном цикле по годам: неполный год не учитывается,
+        # отрицательный срок дает ноль лет
+        years = max(int(customer_lifespan), 0)
+        q = (retention_rate / 100) / (1 + discount_rate)
+        if q == 1:
+            ltv = avg_purchase_value * purchase_frequency * years
+        else:
+            ltv = avg_purchase_value * purchase_frequency * (1 - q ** years) / (1 - q)
     
     return ltv
 
+def calculate_ltv_batch(avg_purchase_value, purchase_frequency, customer_lifespan,
+                        retention_rate, discount_rate=0.1):
+    """
+    Векторный расчет LTV с учетом retention rate для массива клиентов или сценариев
+    
+    Parameters:
+    -----------
+    avg_purchase_value, purchase_frequency, customer_lifespan, retention_rate : array-like
+        Те же параметры, что и в calculate_ltv; массивы транслируются друг на друга
+    discount_rate : float or array-like
+        Ставка дисконтирования
+        
+    Returns:
+    --------
+    ndarray : LTV для каждого набора параметров
+    """
+    value = np.asarray(avg_purchase_value, dtype=np.float64) * np.asarray(purchase_frequency, dtype=np.float64)
+    years = np.maximum(np.trunc(np.asarray(customer_lifespan, dtype=np.float64)), 0)
+    q = (np.asarray(retention_rate, dtype=np.float64) / 100) / (1 + np.asarray(discount_rate, dtype=np.float64))
+    
+    # При q == 1 прогрессия вырождается в сумму одинаковых слагаемых
+    no_decay = q == 1
+    denominator = np.where(no_decay, 1.0, 1 - q)
+    return np.where(no_decay, value * years, value * (1 - q ** years) / denominator)
+
+def _two_proportion_z_test(k1, n1, k2, n2):
+    """
+    Двусторонний z-тест для разницы двух долей
+    
+    Returns:
+    --------
+    float : p-value
+    """
+    p1, p2 = k1 / n1, k2 / n2
+    pooled = (k1 + k2) / (n1 + n2)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / n1 + 1 / n2))
+    if se == 0:
+        # Во всех группах одинаково 0% или 100% конверсий - различий нет
+        return 1.0
+    z = (p1 - p2) / se
+    # 2 * (1 - Ф(|z|)) через дополнительную функцию ошибок
+    return math.erfc(abs(z) / math.sqrt(2))
+
 def simulate_ab_test(n_users=10000, conversion_baseline=0.0335, 
                      effect_recommendations=0.0392, effect_quality=0.045):
     """
@@ -63,45 +115,36 @@ def simulate_ab_test(n_users=10000, conversion_baseline=0.0335,
     --------
     DataFrame : Результаты A/B-теста
     """
-    np.random.seed(42)
-    
-    # Группа A: Без рекомендаций
-    group_a_conversion = np.random.binomial(1, conversion_baseline, n_users//2)
-    
-    # Группа B: С рекомендациями (без учета качества)
-    group_b_conversion = np.random.binomial(1, effect_recommendations, n_users//2)
-    
-    # Группа C: С рекомендациями + качество
-    group_c_conversion = np.random.binomial(1, effect_quality, n_users//2)
+    rng = np.random.default_rng(42)
+    
+    # Столбцы: A - без рекомендаций, B - рекомендации без учета качества,
+    # C - рекомендации + качество. Все группы разыгрываются одним вызовом
+    draws = rng.binomial(
+        1,
+        [conversion_baseline, effect_recommendations, effect_quality],
+        size=(n_users//2, 3)
+    )
     
-    # Результаты
-    results = {
-        'Группа': ['A: Без рекомендаций', 'B: Рекомендации', 'C: Рекомендации + качество'],
-        'Пользователей': [n_users//2, n_users//2, n_users//2],
-        'Конверсия': [
-            group_a_conversion.mean(),
-            group_b_conversion.mean(),
-            group_c_conversion.mean()
-        ]
-    }
+    # Число конверсий и размер каждой группы
+    k_a, k_b, k_c = draws.sum(axis=0)
+    n_a = n_b = n_c = draws.shape[0]
     
-    # Статистическая значимость
-    from scipy.stats import chi2_contingency
+    # Статистическая значимость (z-тест для двух долей)
     
     # Сравнение A vs B
-    contingency_ab = [[sum(group_a_conversion), len(group_a_conversion) - sum(group_a_conversion)],
-                     [sum(group_b_conversion), len(group_b_conversion) - sum(group_b_conversion)]]
-    chi2_ab, p_ab, _, _ = chi2_contingency(contingency_ab)
+    p_ab = _two_proportion_z_test(k_a, n_a, k_b, n_b)
     
     # Сравнение B vs C
-    contingency_bc = [[sum(group_b_conversion), len(group_b_conversion) - sum(group_b_conversion)],
-                     [sum(group_c_conversion), len(group_c_conversion) - sum(group_c_conversion)]]
-    chi2_bc, p_bc, _, _ = chi2_contingency(contingency_bc)
-    
-    results['p-value (vs A)'] = ['-', p_ab, p_bc]
-    results['Стат. значимость'] = ['-', 'ДА' if p_ab < 0.05 else 'НЕТ', 'ДА' if p_bc < 0.05 else 'НЕТ']
+    p_bc = _two_proportion_z_test(k_b, n_b, k_c, n_c)
     
-    return pd.DataFrame(results)
+    # Результаты: все столбцы готовы заранее, таблица собирается за один вызов
+    return pd.DataFrame({
+        'Группа': ['A: Без рекомендаций', 'B: Рекомендации', 'C: Рекомендации + качество'],
+        'Пользователей': [n_a, n_b, n_c],
+        'Конверсия': draws.mean(axis=0),
+        'p-value (vs A)': ['-', p_ab, p_bc],
+        'Стат. значимость': ['-', 'ДА' if p_ab < 0.05 else 'НЕТ', 'ДА' if p_bc < 0.05 else 'НЕТ']
+    })
 
 def calculate_ltv_scenarios(avg_course_price=15000, avg_customer_lifespan=2, discount_rate=0.1):
     """
@@ -111,64 +154,34 @@ def calculate_ltv_scenarios(avg_course_price=15000, avg_customer_lifespan=2, dis
     --------
     DataFrame : Сравнение LTV по сценариям
     """
-    # Сценарий 1: Базовый (без рекомендательной системы)
-    ltv_baseline = calculate_ltv(
-        avg_purchase_value=avg_course_price,
-        purchase_frequency=1.0,
-        customer_lifespan=avg_customer_lifespan,
-        retention_rate=20,
-        discount_rate=discount_rate
-    )
-    
-    # Сценарий 2: С рекомендательной системой (без учета качества)
-    ltv_recommendations = calculate_ltv(
-        avg_purchase_value=avg_course_price * 1.17,
-        purchase_frequency=1.2,
-        customer_lifespan=avg_customer_lifespan,
-        retention_rate=20,
-        discount_rate=discount_rate
-    )
-    
-    # Сценарий 3: С рекомендательной системой + только качественные курсы
-    ltv_quality_recommendations = calculate_ltv(
-        avg_purchase_value=avg_course_price * 1.15,
-        purchase_frequency=1.15,
-        customer_lifespan=avg_customer_lifespan * 1.5,
-        retention_rate=35,
-        discount_rate=discount_rate
-    )
-    
-    # Сценарий 4: Идеальный (качественные курсы + персонализация)
-    ltv_ideal = calculate_ltv(
-        avg_purchase_value=avg_course_price * 1.25,
-        purchase_frequency=1.3,
-        customer_lifespan=avg_customer_lifespan * 2,
-        retention_rate=50,
-        discount_rate=discount_rate
-    )
+    # Параметры сценариев (по одному элементу на сценарий):
+    # 1. Базовый (без рекомендательной системы)
+    # 2. С рекомендательной системой (без учета качества)
+    # 3. С рекомендательной системой + только качественные курсы
+    # 4. Идеальный (качественные курсы + персонализация)
+    scenarios = [
+        'Базовый (без рекомендаций)',
+        'Рекомендации без учета качества',
+        'Рекомендации + качество курсов',
+        'Идеальный (качество + персонализация)'
+    ]
+    prices = np.array([1.0, 1.17, 1.15, 1.25]) * avg_course_price
+    frequencies = np.array([1.0, 1.2, 1.15, 1.3])
+    lifespans = np.array([1.0, 1.0, 1.5, 2.0]) * avg_customer_lifespan
+    retention_rates = np.array([20, 20, 35, 50])
+    
+    # LTV всех сценариев считаем одним векторным вызовом
+    ltv_values = calculate_ltv_batch(prices, frequencies, lifespans, retention_rates, discount_rate)
+    growth = (ltv_values[1:] / ltv_values[0] - 1) * 100
     
     # Создаем таблицу сравнения
     ltv_comparison = pd.DataFrame({
-        'Сценарий': [
-            'Базовый (без рекомендаций)',
-            'Рекомендации без учета качества',
-            'Рекомендации + качество курсов',
-            'Идеальный (качество + персонализация)'
-        ],
-        'LTV (руб.)': [ltv_baseline, ltv_recommendations, ltv_quality_recommendations, ltv_ideal],
-        'Рост vs базовый': ['-', 
-                           f'+{(ltv_recommendations/ltv_baseline-1)*100:.1f}%',
-                           f'+{(ltv_quality_recommendations/ltv_baseline-1)*100:.1f}%',
-                           f'+{(ltv_ideal/ltv_baseline-1)*100:.1f}%'],
-        'Средний чек': [avg_course_price, 
-                       avg_course_price * 1.17,
-                       avg_course_price * 1.15,
-                       avg_course_price * 1.25],
-        'Retention rate': ['20%', '20%', '35%', '50%'],
-        'Срок жизни (лет)': [avg_customer_lifespan, 
-                            avg_customer_lifespan,
-                            avg_customer_lifespan * 1.5,
-                            avg_customer_lifespan * 2]
+        'Сценарий': scenarios,
+        'LTV (руб.)': ltv_values,
+        'Рост vs базовый': ['-'] + [f'+{value:.1f}%' for value in growth],
+        'Средний чек': prices,
+        'Retention rate': [f'{rate}%' for rate in retention_rates],
+        'Срок жизни (лет)': lifespans
     })
     
     return ltv_comparison
@@ -177,6 +190,9 @@ def plot_ltv_comparison(ltv_comparison, save_path=None):
     """
     Визуализация сравнения LTV по сценариям
     """
+    # pyplot импортируем только при построении графиков: он долго загружается
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(1, 2, figsize=(14, 6))
     
     # 1. Сравнение LTV по сценариям
@@ -191,29 +207,25 @@ def plot_ltv_comparison(ltv_comparison, save_path=None):
     axes[0].grid(True, alpha=0.3, axis='y')
     
     # Добавляем значения на столбцы
-    for bar, value in zip(bars, ltv_values):
-        height = bar.get_height()
-        axes[0].text(bar.get_x() + bar.get_width()/2, height + 2,
-                    f'{value:,.0f}K', ha='center', va='bottom', fontweight='bold')
+    axes[0].bar_label(bars, labels=[f'{value:,.0f}K' for value in ltv_values],
+                      padding=3, fontweight='bold')
     
     # 2. Рост LTV vs базовый сценарий
     growth_values = [(v/ltv_values[0]-1)*100 for v in ltv_values][1:]  # Пропускаем базовый
     growth_scenarios = scenarios[1:]
     
-    axes[1].bar(growth_scenarios, growth_values, color=['#f39c12', '#2ecc71', '#3498db'], 
-                edgecolor='black')
+    growth_bars = axes[1].bar(growth_scenarios, growth_values, color=['#f39c12', '#2ecc71', '#3498db'], 
+                              edgecolor='black')
     axes[1].set_title('Рост LTV относительно базового сценария', fontsize=12, fontweight='bold')
     axes[1].set_ylabel('Рост LTV, %', fontsize=11)
     axes[1].set_xticklabels(growth_scenarios, rotation=45, ha='right')
     axes[1].axhline(0, color='black', linewidth=0.5)
     axes[1].grid(True, alpha=0.3, axis='y')
     
-    # Добавляем значения
-    for i, value in enumerate(growth_values):
-        axes[1].text(i, value + 2 if value > 0 else value - 10, 
-                    f'+{value:.1f}%' if value > 0 else f'{value:.1f}%',
-                    ha='center', va='bottom' if value > 0 else 'top',
-                    fontweight='bold')
+    # Добавляем значения (для отрицательного роста bar_label сам ставит подпись под столбец)
+    axes[1].bar_label(growth_bars,
+                      labels=[f'+{value:.1f}%' if value > 0 else f'{value:.1f}%' for value in growth_values],
+                      padding=3, fontweight='bold')
     
     plt.suptitle('Анализ LTV (Lifetime Value)', fontsize=14, fontweight='bold')
     plt.tight_layout()
@@ -221,8 +233,10 @@ def plot_ltv_comparison(ltv_comparison, save_path=None):
     if save_path:
         plt.savefig(save_path, dpi=300, bbox_inches='tight')
         print(f"📈 График LTV сохранен: {save_path}")
-    
-    plt.show()
+        # В отчетном режиме окно не открываем и сразу освобождаем фигуру
+        plt.close(fig)
+    else:
+        plt.show()
     
     return fig
 
@@ -230,7 +244,9 @@ def plot_ab_test_results(ab_test_results, save_path=None):
     """
     Визуализация результатов A/B-теста
     """
-    plt.figure(figsize=(10, 6))
+    import matplotlib.pyplot as plt
+    
+    fig = plt.figure(figsize=(10, 6))
     groups = ab_test_results['Группа']
     conversion_rates = ab_test_results['Конверсия'] * 100
     
@@ -242,10 +258,8 @@ def plot_ab_test_results(ab_test_results, save_path=None):
     plt.grid(True, alpha=0.3, axis='y')
     
     # Добавляем значения на столбцы
-    for bar, rate in zip(bars, conversion_rates):
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2, height + 0.1,
-                f'{rate:.2f}%', ha='center', va='bottom', fontweight='bold')
+    plt.gca().bar_label(bars, labels=[f'{rate:.2f}%' for rate in conversion_rates],
+                        padding=3, fontweight='bold')
     
     # Добавляем линии сравнения
     plt.axhline(conversion_rates[0], color='#e74c3c', linestyle='--', alpha=0.5, label='Базовый уровень')
@@ -255,8 +269,9 @@ def plot_ab_test_results(ab_test_results, save_path=None):
     if save_path:
         plt.savefig(save_path, dpi=300, bbox_inches='tight')
         print(f"📊 График A/B-теста сохранен: {save_path}")
-    
-    plt.show()
+        plt.close(fig)
+    else:
+        plt.show()
 
 def calculate_roi(development_cost, monthly_maintenance, monthly_revenue_increase, months=12):
     """
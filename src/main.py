@@ -4,8 +4,13 @@
 
 import os
 import sys
+import logging
 from datetime import datetime
 
+# Отчет строится без GUI: неинтерактивный backend выбираем до импорта pyplot
+import matplotlib
+matplotlib.use('Agg')
+
 # Добавляем src в путь импорта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -35,6 +40,9 @@ def save_results(output_folder="results"):
 
 def main():
     """Основная функция анализа"""
+    # Сообщения модулей выводим в тот же поток, что и отчет
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
     print("=" * 80)
     print("🚀 ЗАПУСК АНАЛИЗА РЕКОМЕНДАТЕЛЬНОЙ СИСТЕМЫ")
     print("=" * 80)
@@ -4,9 +4,6 @@
 
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import MinMaxScaler
 
 def create_synthetic_quality_metrics(course_ids):
     """
@@ -21,43 +18,56 @@ def create_synthetic_quality_metrics(course_ids):
     --------
     DataFrame : Метрики качества для каждого курса
     """
-    np.random.seed(42)
+    rng = np.random.default_rng(42)
     n_courses = len(course_ids)
     
     print(f"📊 Создание синтетических метрик качества для {n_courses} курсов...")
     
+    # COR (Completion Rate) - процент студентов, завершивших курс
+    cor = rng.beta(5, 2, n_courses) * 40 + 30  # 30-70%
+    
+    # CSI (Customer Satisfaction Index) - удовлетворенность
+    csi = rng.beta(8, 2, n_courses) * 2 + 3  # 3-5 баллов
+    
+    # NPS (Net Promoter Score) - лояльность
+    nps = rng.normal(20, 30, n_courses)  # -50 до 80
+    
+    # Среднее время проверки ДЗ (в часах)
+    homework_check_time = rng.exponential(24, n_courses)
+    
+    # Retention rate - вероятность покупки следующего курса
+    retention_rate = rng.beta(3, 5, n_courses) * 40 + 10  # 10-50%
+    
+    # Процент положительных отзывов
+    positive_reviews = rng.beta(8, 2, n_courses) * 40 + 40  # 40-80%
+    
+    # Рейтинг преподавателя
+    teacher_rating = rng.beta(9, 2, n_courses) * 2 + 3  # 3-5 баллов
+    
+    # Ограничиваем значения в разумных пределах (на месте, без копий массивов)
+    np.clip(nps, -100, 100, out=nps)
+    np.clip(homework_check_time, 1, 168, out=homework_check_time)
+    np.clip(retention_rate, 5, 80, out=retention_rate)
+    
+    # ID курсов сужаем до int32, только если они помещаются в его диапазон
+    ids = np.asarray(course_ids, dtype=np.int64)
+    int32 = np.iinfo(np.int32)
+    if ids.size == 0 or (ids.min() >= int32.min and ids.max() <= int32.max):
+        ids = ids.astype(np.int32)
+    
     # Создаем DataFrame с метриками качества
     quality_metrics = pd.DataFrame({
-        'course_id': course_ids,
+        'course_id': ids,
         'course_name': [f'Курс {i}' for i in course_ids],
-        
-        # COR (Completion Rate) - процент студентов, завершивших курс
-        'cor': np.random.beta(5, 2, n_courses) * 40 + 30,  # 30-70%
-        
-        # CSI (Customer Satisfaction Index) - удовлетворенность
-        'csi': np.random.beta(8, 2, n_courses) * 2 + 3,  # 3-5 баллов
-        
-        # NPS (Net Promoter Score) - лояльность
-        'nps': np.random.normal(20, 30, n_courses),  # -50 до 80
-        
-        # Среднее время проверки ДЗ (в часах)
-        'homework_check_time': np.random.exponential(24, n_courses),
-        
-        # Retention rate - вероятность покупки следующего курса
-        'retention_rate': np.random.beta(3, 5, n_courses) * 40 + 10,  # 10-50%
-        
-        # Процент положительных отзывов
-        'positive_reviews': np.random.beta(8, 2, n_courses) * 40 + 40,  # 40-80%
-        
-        # Рейтинг преподавателя
-        'teacher_rating': np.random.beta(9, 2, n_courses) * 2 + 3,  # 3-5 баллов
+        'cor': cor,
+        'csi': csi,
+        'nps': nps,
+        'homework_check_time': homework_check_time,
+        'retention_rate': retention_rate,
+        'positive_reviews': positive_reviews,
+        'teacher_rating': teacher_rating,
     })
     
-    # Ограничиваем значения в разумных пределах
-    quality_metrics['nps'] = quality_metrics['nps'].clip(-100, 100)
-    quality_metrics['homework_check_time'] = quality_metrics['homework_check_time'].clip(1, 168)
-    quality_metrics['retention_rate'] = quality_metrics['retention_rate'].clip(5, 80)
-    
     # Рассчитываем интегральный показатель качества
     quality_metrics = calculate_quality_score(quality_metrics)
     
@@ -68,43 +78,32 @@ def calculate_quality_score(quality_metrics):
     """
     Рассчитывает интегральный показатель качества курса
     """
-    # Создаем временные нормализованные значения
-    quality_metrics['cor_norm'] = quality_metrics['cor'] / 100
-    quality_metrics['csi_norm'] = (quality_metrics['csi'] - 1) / 4  # 1-5 -> 0-1
-    quality_metrics['nps_norm'] = (quality_metrics['nps'] + 100) / 200  # -100..100 -> 0-1
-    quality_metrics['hw_norm'] = 1 - (quality_metrics['homework_check_time'].clip(1, 72) / 72)
-    quality_metrics['retention_norm'] = quality_metrics['retention_rate'] / 100
-    quality_metrics['reviews_norm'] = quality_metrics['positive_reviews'] / 100
-    quality_metrics['teacher_norm'] = (quality_metrics['teacher_rating'] - 1) / 4
-    
-    # Веса для каждой метрики
-    weights = {
-        'cor_norm': 0.25,
-        'csi_norm': 0.20,
-        'nps_norm': 0.15,
-        'hw_norm': 0.10,
-        'retention_norm': 0.15,
-        'reviews_norm': 0.10,
-        'teacher_norm': 0.05
-    }
-    
-    # Рассчитываем итоговый score
-    quality_metrics['quality_score'] = 0
-    for col, weight in weights.items():
-        quality_metrics['quality_score'] += quality_metrics[col] * weight
-    
-    # Масштабируем до 0-100
-    quality_metrics['quality_score'] = quality_metrics['quality_score'] * 100
-    
-    # Добавляем категорию качества
-    quality_metrics['quality_category'] = quality_metrics['quality_score'].apply(
-        lambda x: 'Высокое' if x >= 70 else 'Среднее' if x >= 50 else 'Низкое'
+    # Нормализуем метрики к 0-1 как локальные массивы, не добавляя временных столбцов
+    norm_matrix = np.column_stack([
+        quality_metrics['cor'].to_numpy() / 100,
+        (quality_metrics['csi'].to_numpy() - 1) / 4,  # 1-5 -> 0-1
+        (quality_metrics['nps'].to_numpy() + 100) / 200,  # -100..100 -> 0-1
+        1 - np.clip(quality_metrics['homework_check_time'].to_numpy(), 1, 72) / 72,
+        quality_metrics['retention_rate'].to_numpy() / 100,
+        quality_metrics['positive_reviews'].to_numpy() / 100,
+        (quality_metrics['teacher_rating'].to_numpy() - 1) / 4,
+    ])
+    
+    # Веса для каждой метрики (в порядке столбцов norm_matrix):
+    # COR, CSI, NPS, время проверки ДЗ, retention, отзывы, преподаватель
+    weights = np.array([0.25, 0.20, 0.15, 0.10, 0.15, 0.10, 0.05])
+    
+    # Рассчитываем итоговый score одним матричным умножением и масштабируем до 0-100
+    quality_metrics['quality_score'] = norm_matrix @ weights * 100
+    
+    # Добавляем категорию качества (упорядоченная: Низкое < Среднее < Высокое)
+    scores = quality_metrics['quality_score'].to_numpy()
+    quality_metrics['quality_category'] = pd.Categorical(
+        np.select([scores >= 70, scores >= 50], ['Высокое', 'Среднее'], default='Низкое'),
+        categories=['Низкое', 'Среднее', 'Высокое'],
+        ordered=True
     )
     
-    # Удаляем временные столбцы
-    cols_to_drop = [col for col in quality_metrics.columns if col.endswith('_norm')]
-    quality_metrics = quality_metrics.drop(columns=cols_to_drop)
-    
     return quality_metrics
 
 def analyze_quality_distribution(quality_metrics):
@@ -134,42 +133,49 @@ def analyze_quality_distribution(quality_metrics):
     
     return category_counts, correlation_matrix
 
+def _plot_hist(ax, values, title, xlabel, color, bins=20):
+    """
+    Рисует гистограмму по заранее посчитанным частотам (np.histogram + bar).
+    Пропуски (NaN, inf) отбрасываются, как это делает ax.hist
+    """
+    values = np.asarray(values, dtype=np.float64)
+    counts, edges = np.histogram(values[np.isfinite(values)], bins=bins)
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge',
+           edgecolor='black', alpha=0.7, color=color)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+
 def plot_quality_distribution(quality_metrics, save_path=None):
     """
     Создает визуализацию распределения качества курсов
     """
+    # pyplot импортируем только при построении графиков: он долго загружается
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(2, 3, figsize=(15, 10))
     
     # 1. Распределение COR
-    axes[0, 0].hist(quality_metrics['cor'], bins=20, edgecolor='black', alpha=0.7, color='skyblue')
-    axes[0, 0].set_title('Completion Rate (COR)')
-    axes[0, 0].set_xlabel('Процент завершивших курс')
+    _plot_hist(axes[0, 0], quality_metrics['cor'], 'Completion Rate (COR)', 'Процент завершивших курс', 'skyblue')
     axes[0, 0].set_ylabel('Количество курсов')
     
     # 2. Распределение CSI
-    axes[0, 1].hist(quality_metrics['csi'], bins=20, edgecolor='black', alpha=0.7, color='lightgreen')
-    axes[0, 1].set_title('Customer Satisfaction Index (CSI)')
-    axes[0, 1].set_xlabel('Удовлетворенность (1-5)')
+    _plot_hist(axes[0, 1], quality_metrics['csi'], 'Customer Satisfaction Index (CSI)', 'Удовлетворенность (1-5)', 'lightgreen')
     
     # 3. Распределение NPS
-    axes[0, 2].hist(quality_metrics['nps'], bins=20, edgecolor='black', alpha=0.7, color='salmon')
-    axes[0, 2].set_title('Net Promoter Score (NPS)')
-    axes[0, 2].set_xlabel('NPS (-100 до 100)')
+    _plot_hist(axes[0, 2], quality_metrics['nps'], 'Net Promoter Score (NPS)', 'NPS (-100 до 100)', 'salmon')
     
     # 4. Распределение Retention Rate
-    axes[1, 0].hist(quality_metrics['retention_rate'], bins=20, edgecolor='black', alpha=0.7, color='gold')
-    axes[1, 0].set_title('Retention Rate')
-    axes[1, 0].set_xlabel('Процент повторных покупок')
+    _plot_hist(axes[1, 0], quality_metrics['retention_rate'], 'Retention Rate', 'Процент повторных покупок', 'gold')
     axes[1, 0].set_ylabel('Количество курсов')
     
     # 5. Распределение времени проверки ДЗ
-    axes[1, 1].hist(quality_metrics['homework_check_time'], bins=20, edgecolor='black', alpha=0.7, color='violet')
-    axes[1, 1].set_title('Время проверки домашних заданий')
-    axes[1, 1].set_xlabel('Часы')
+    _plot_hist(axes[1, 1], quality_metrics['homework_check_time'], 'Время проверки домашних заданий', 'Часы', 'violet')
     
     # 6. Распределение интегрального качества
-    colors = ['red' if x < 50 else 'orange' if x < 70 else 'green' for x in quality_metrics['quality_score']]
-    axes[1, 2].bar(range(len(quality_metrics)), sorted(quality_metrics['quality_score']), color=colors)
+    # Цвета считаем по уже отсортированным значениям, чтобы они совпадали со столбцами
+    sorted_scores = np.sort(quality_metrics['quality_score'].to_numpy())
+    colors = np.where(sorted_scores < 50, 'red', np.where(sorted_scores < 70, 'orange', 'green'))
+    axes[1, 2].bar(np.arange(len(sorted_scores)), sorted_scores, color=colors)
     axes[1, 2].set_title('Интегральный показатель качества')
     axes[1, 2].set_xlabel('Курсы (отсортированы)')
     axes[1, 2].set_ylabel('Quality Score')
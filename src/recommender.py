@@ -4,13 +4,26 @@
 
 import pandas as pd
 import numpy as np
-from itertools import combinations
 from collections import Counter
 
+_INT32 = np.iinfo(np.int32)
+
+def _to_id_array(values):
+    """
+    Приводит ID курсов к int32, если все значения помещаются в его диапазон,
+    иначе к int64: молчаливое переполнение склеило бы разные курсы
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind not in 'iu':
+        arr = arr.astype(np.int64)
+    if arr.size == 0 or (arr.min() >= _INT32.min and arr.max() <= _INT32.max):
+        return arr.astype(np.int32, copy=False)
+    return arr.astype(np.int64, copy=False)
+
 class CourseRecommender:
     """Рекомендательная система с учетом качества курсов"""
     
-    def __init__(self, pair_counts, quality_metrics, all_courses, threshold=9):
+    def __init__(self, pair_counts, quality_metrics, all_courses, threshold=9, random_state=42):
         """
         Инициализация рекомендательной системы
         
@@ -24,13 +37,29 @@ class CourseRecommender:
             Все уникальные курсы
         threshold : int
             Минимальная частота для учета пары
+        random_state : int or None
+            Seed генератора для случайного добора рекомендаций
         """
-        self.pair_counts = {pair: count for pair, count in pair_counts.items() if count > threshold}
+        # Пары храним параллельными массивами (course1, course2) и частотами:
+        # отбор частых пар - одна булева маска вместо обхода словаря
+        n_pairs = len(pair_counts)
+        pairs = _to_id_array(list(pair_counts.keys())).reshape(n_pairs, 2)
+        counts = np.fromiter(pair_counts.values(), dtype=np.int32, count=n_pairs)
+        mask = counts > threshold
+        self.pair_courses = pairs[mask]
+        self.pair_freqs = counts[mask]
         self.quality_metrics = quality_metrics.set_index('course_id')
-        self.all_courses = set(all_courses)
+        # Словарь course_id -> quality_score: поиск по нему намного дешевле, чем .loc
+        self._score_cache = self.quality_metrics['quality_score'].to_dict()
+        # Отсортированный массив курсов для векторных операций и множество для проверки вхождения
+        # (принимаем любой итерируемый объект, как раньше set(all_courses))
+        self.all_courses_arr = _to_id_array(sorted(set(all_courses)))
+        self.all_courses = frozenset(self.all_courses_arr.tolist())
         self.threshold = threshold
+        self.rng = np.random.default_rng(random_state)
         
-        # Создаем индекс рекомендаций
+        # Ранжируем кандидатов и создаем индекс рекомендаций
+        self._ranked_pairs = self._rank_pairs()
         self.recommendation_index = self._build_recommendation_index()
         
         print(f"🤖 Рекомендательная система создана:")
@@ -38,36 +67,65 @@ class CourseRecommender:
         print(f"   • Курсов в частых парах: {len(self.recommendation_index)}")
         print(f"   • Курсов без частых пар: {len(self.all_courses) - len(self.recommendation_index)}")
     
+    def _rank_pairs(self):
+        """
+        Строит отсортированную таблицу кандидатов: для каждого курса все его
+        частые пары по убыванию веса (столбцы course_id, candidate, weight)
+        """
+        if len(self.pair_freqs) == 0:
+            return pd.DataFrame({
+                'course_id': np.array([], dtype=np.int32),
+                'candidate': np.array([], dtype=np.int32),
+                'weight': np.array([], dtype=np.float64)
+            })
+        
+        n_pairs = len(self.pair_freqs)
+        courses1, courses2 = self.pair_courses[:, 0], self.pair_courses[:, 1]
+        counts = self.pair_freqs
+        
+        # Получаем качество курсов (0-1, для курсов без метрик - 0.5)
+        score_map = self._score_cache
+        scores1 = np.fromiter((score_map.get(c, 50) for c in courses1.tolist()), dtype=np.float64, count=n_pairs) / 100
+        scores2 = np.fromiter((score_map.get(c, 50) for c in courses2.tolist()), dtype=np.float64, count=n_pairs) / 100
+        
+        # Комбинированный вес: частота * среднее качество, сразу для всех пар
+        weights = counts * ((scores1 + scores2) / 2)
+        
+        # Каждая пара дает кандидата обоим курсам; чередуем направления,
+        # чтобы при равных весах сохранялся порядок пар
+        course_ids = np.column_stack([courses1, courses2]).ravel()
+        candidates = np.column_stack([courses2, courses1]).ravel()
+        pair_weights = np.repeat(weights, 2)
+        
+        # Одна устойчивая сортировка: по курсу, внутри курса по убыванию веса
+        order = np.lexsort((-pair_weights, course_ids))
+        return pd.DataFrame({
+            'course_id': course_ids[order],
+            'candidate': candidates[order],
+            'weight': pair_weights[order]
+        })
+    
     def _build_recommendation_index(self):
         """Создает индекс рекомендаций для каждого курса"""
-        index = {}
-        for (course1, course2), count in self.pair_counts.items():
-            # Получаем качество курсов
-            score1 = self._get_course_score(course1)
-            score2 = self._get_course_score(course2)
-            
-            # Комбинированный вес: частота * среднее качество
-            weight = count * ((score1 + score2) / 2)
-            
-            if course1 not in index:
-                index[course1] = []
-            index[course1].append((course2, weight))
-            
-            if course2 not in index:
-                index[course2] = []
-            index[course2].append((course1, weight))
+        ranked = self._ranked_pairs
+        if ranked.empty:
+            return {}
         
-        # Сортируем рекомендации по весу (убывающая)
-        for course in index:
-            index[course].sort(key=lambda x: x[1], reverse=True)
-            
-        return index
+        # Таблица уже отсортирована по курсу, поэтому списки курсов - непрерывные срезы
+        course_ids = ranked['course_id'].to_numpy()
+        courses, starts = np.unique(course_ids, return_index=True)
+        candidates = np.split(ranked['candidate'].to_numpy(), starts[1:])
+        weights = np.split(ranked['weight'].to_numpy(), starts[1:])
+        
+        return {
+            course: list(zip(course_candidates.tolist(), course_weights.tolist()))
+            for course, course_candidates, course_weights in zip(courses.tolist(), candidates, weights)
+        }
     
     def _get_course_score(self, course_id):
         """Получает интегральный показатель качества курса"""
-        if course_id in self.quality_metrics.index:
-            return self.quality_metrics.loc[course_id, 'quality_score'] / 100  # Нормализуем до 0-1
-        return 0.5  # Значение по умолчанию
+        # Нормализуем до 0-1; для курсов без метрик значение по умолчанию 0.5
+        return self._score_cache.get(course_id, 50) / 100
     
     def get_recommendations(self, course_id, n=2, min_quality=50):
         """
@@ -110,54 +168,57 @@ class CourseRecommender:
         --------
         DataFrame : Таблица с рекомендациями
         """
-        recommendations = []
+        course_ids = self.all_courses_arr
         
-        for course_id in sorted(self.all_courses):
-            recs = self.get_recommendations(course_id, n, min_quality)
-            
-            # Если рекомендаций меньше, чем нужно, ищем курсы с высоким качеством
-            if len(recs) < n:
-                # Ищем курсы с высоким качеством, отличные от текущего
-                if hasattr(self.quality_metrics, 'index'):
-                    high_quality_courses = self.quality_metrics[
-                        (self.quality_metrics['quality_score'] >= min_quality) &
-                        (self.quality_metrics.index != course_id)
-                    ].index.tolist()
-                else:
-                    high_quality_courses = []
-                
-                # Исключаем уже рекомендованные
-                available = [c for c in high_quality_courses if c not in recs]
-                
-                # Добираем нужное количество
-                while len(recs) < n and available:
-                    new_rec = np.random.choice(available)
-                    recs.append(new_rec)
-                    available.remove(new_rec)
-            
-            # Заполняем None, если все еще не хватает
-            while len(recs) < n:
-                recs.append(None)
+        # Кандидаты из частых пар, прошедшие порог качества: первые n для каждого курса
+        ranked = self._ranked_pairs
+        candidate_quality = ranked['candidate'].map(self._score_cache).fillna(50).to_numpy()
+        top = ranked[candidate_quality >= min_quality].groupby('course_id', sort=False).head(n)
+        recs_table = (
+            top.assign(rank=top.groupby('course_id', sort=False).cumcount())
+            .pivot(index='course_id', columns='rank', values='candidate')
+            .reindex(index=course_ids, columns=range(n))
+        )
+        
+        # Курсы с высоким качеством для добора: отбираем и перемешиваем один раз,
+        # дальше берем по кругу
+        scores = self.quality_metrics['quality_score']
+        fallback_pool = self.rng.permutation(scores.index[scores >= min_quality].to_numpy()).tolist()
+        pool_pos = 0
+        
+        # Если рекомендаций меньше, чем нужно, добираем из пула
+        for course_id in recs_table.index[recs_table.isna().any(axis=1)]:
+            recs = [int(c) for c in recs_table.loc[course_id].dropna()]
             
-            # Получаем качество рекомендаций
-            rec_quality = []
-            for rec in recs:
-                if rec is not None and rec in self.quality_metrics.index:
-                    rec_quality.append(self.quality_metrics.loc[rec, 'quality_score'])
-                else:
-                    rec_quality.append(None)
+            # Пропускаем текущий курс и уже рекомендованные; не больше одного круга
+            checked = 0
+            while len(recs) < n and checked < len(fallback_pool):
+                candidate = fallback_pool[pool_pos]
+                pool_pos = (pool_pos + 1) % len(fallback_pool)
+                checked += 1
+                if candidate != course_id and candidate not in recs:
+                    recs.append(candidate)
             
-            recommendations.append({
-                'course_id': course_id,
-                'course_quality': self._get_course_score(course_id) * 100,
-                'recomm_one': recs[0],
-                'recomm_one_quality': rec_quality[0],
-                'recomm_two': recs[1],
-                'recomm_two_quality': rec_quality[1],
-                'has_recommendations': recs[0] is not None
-            })
+            # Заполняем пропуски, если все еще не хватает
+            recs_table.loc[course_id] = recs + [np.nan] * (n - len(recs))
+        
+        recomm_one = recs_table[0].astype('Int64')
+        recomm_two = recs_table[1].astype('Int64')
         
-        return pd.DataFrame(recommendations)
+        # Качество рекомендаций: одно сопоставление по словарю на столбец,
+        # для пустых рекомендаций и курсов без метрик - NaN
+        recomm_one_quality = recomm_one.map(self._score_cache).to_numpy(dtype=np.float64, na_value=np.nan)
+        recomm_two_quality = recomm_two.map(self._score_cache).to_numpy(dtype=np.float64, na_value=np.nan)
+        
+        return pd.DataFrame({
+            'course_id': course_ids,
+            'course_quality': [self._get_course_score(course_id) * 100 for course_id in course_ids.tolist()],
+            'recomm_one': recomm_one.array,
+            'recomm_one_quality': recomm_one_quality,
+            'recomm_two': recomm_two.array,
+            'recomm_two_quality': recomm_two_quality,
+            'has_recommendations': recomm_one.notna().to_numpy()
+        })
     
     def get_recommendation_statistics(self, recommendations_df):
         """
@@ -172,13 +233,15 @@ class CourseRecommender:
         print(f"   • Всего курсов: {total_courses}")
         print(f"   • Курсов с рекомендациями: {courses_with_recs} ({courses_with_recs/total_courses*100:.1f}%)")
         
-        # Среднее качество рекомендаций
+        # Среднее качество рекомендаций: одно среднее по всем заполненным ячейкам
         quality_cols = ['recomm_one_quality', 'recomm_two_quality']
-        avg_quality = recommendations_df[quality_cols].mean().mean()
+        qualities = recommendations_df[quality_cols].to_numpy(dtype=np.float32, na_value=np.nan)
+        avg_quality = float(np.nanmean(qualities))
         print(f"   • Среднее качество рекомендаций: {avg_quality:.1f}")
         
         # Распределение по количеству рекомендаций
-        rec_counts = recommendations_df[['recomm_one', 'recomm_two']].notna().sum(axis=1)
+        recs = recommendations_df[['recomm_one', 'recomm_two']].to_numpy(dtype=np.float32, na_value=np.nan)
+        rec_counts = (~np.isnan(recs)).sum(axis=1)
         for count in [0, 1, 2]:
             count_courses = (rec_counts == count).sum()
             print(f"   • Курсов с {count} рекомендациями: {count_courses} ({count_courses/total_courses*100:.1f}%)")
@@ -196,7 +259,8 @@ def analyze_joint_purchases(purchase_data):
     Parameters:
     -----------
     purchase_data : DataFrame
-        Данные о покупках курсов
+        Данные о покупках курсов (user_id, course_id) или готовые списки
+        курсов пользователей (user_id, courses) из load_user_course_lists
         
     Returns:
     --------
@@ -205,26 +269,50 @@ def analyze_joint_purchases(purchase_data):
     """
     print("🔄 Анализ совместных покупок...")
     
-    # Создаем список курсов для каждого пользователя
-    user_courses = purchase_data.groupby('user_id')['course_id'].apply(list).reset_index()
+    # Приводим данные к длинному формату (user_id, course_id); списки из базы разворачиваем
+    if 'courses' in purchase_data.columns:
+        purchases = (
+            purchase_data[['user_id', 'courses']]
+            .explode('courses')
+            .dropna()
+            .rename(columns={'courses': 'course_id'})
+            .astype({'course_id': np.int64})
+        )
+    else:
+        # Без приведения типов: np.unique ниже все равно переводит ID в компактные индексы
+        purchases = purchase_data[['user_id', 'course_id']]
     
-    # Создаем все возможные пары курсов для каждого пользователя
-    all_pairs = []
-    for courses in user_courses['course_id']:
-        if len(courses) >= 2:
-            pairs = list(combinations(sorted(courses), 2))
-            all_pairs.extend(pairs)
+    # Частоты пар - произведение разреженной матрицы покупок (пользователи x курсы)
+    # на саму себя: элемент (a, b) равен числу совместных покупок курсов a и b.
+    # Памяти нужно по числу различных пар, а не по числу всех пар всех пользователей
+    from scipy import sparse
+    
+    users, user_idx = np.unique(purchases['user_id'].to_numpy(), return_inverse=True)
+    courses, course_idx = np.unique(purchases['course_id'].to_numpy(), return_inverse=True)
+    purchase_matrix = sparse.csr_matrix(
+        (np.ones(len(purchases), dtype=np.int32), (user_idx, course_idx)),
+        shape=(len(users), len(courses))
+    )
+    # Верхний треугольник без диагонали: каждая пара один раз, course1 < course2
+    co_purchases = sparse.triu(purchase_matrix.T @ purchase_matrix, k=1).tocoo()
     
     # Подсчитываем частоту пар
-    pair_counts = Counter(all_pairs)
+    pair_counts = Counter(dict(zip(
+        zip(courses[co_purchases.row].tolist(), courses[co_purchases.col].tolist()),
+        co_purchases.data.tolist()
+    )))
     
     print(f"   • Всего уникальных пар курсов: {len(pair_counts):,}")
-    print(f"   • Всего совместных покупок: {len(all_pairs):,}")
+    print(f"   • Всего совместных покупок: {int(co_purchases.data.sum()):,}")
     
-    # Создаем DataFrame для анализа
-    pair_freq_df = pd.DataFrame(pair_counts.most_common(), columns=['pair', 'frequency'])
-    pair_freq_df['course1'] = pair_freq_df['pair'].apply(lambda x: x[0])
-    pair_freq_df['course2'] = pair_freq_df['pair'].apply(lambda x: x[1])
+    # Создаем DataFrame для анализа сразу из массивов, без столбца кортежей
+    top_pairs = pair_counts.most_common()
+    pairs = _to_id_array([pair for pair, _ in top_pairs]).reshape(len(top_pairs), 2)
+    pair_freq_df = pd.DataFrame({
+        'course1': pairs[:, 0],
+        'course2': pairs[:, 1],
+        'frequency': np.fromiter((freq for _, freq in top_pairs), dtype=np.int32, count=len(top_pairs))
+    })
     
     return pair_counts, pair_freq_df
 